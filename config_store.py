@@ -0,0 +1,277 @@
+"""
+設定ファイル管理モジュール
+
+config.yaml の読み書き、スキーマ検証、変更監視を行う。
+パース結果は内容のハッシュをキーにキャッシュし、
+内容が変わらない限りYAMLの再パースを省略する。
+"""
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import yaml
+
+# C実装のローダーがあれば使用（大量の商品でもパースを高速化）
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# パース済み設定のキャッシュ保存先（設定ファイルと同じディレクトリ）
+CACHE_DIR_NAME = ".cache"
+
+
+def _cache_path(config_path: Path) -> Path:
+    return config_path.parent / CACHE_DIR_NAME / f"{config_path.name}.json"
+
+
+def _read_cache(config_path: Path, digest: str) -> dict | None:
+    """ハッシュが一致するキャッシュがあれば返す"""
+    try:
+        with open(_cache_path(config_path), "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("hash") != digest:
+        return None
+    return cached.get("config")
+
+
+def _is_json_exact(value) -> bool:
+    """JSONで型を変えずに保存・復元できる値か判定"""
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return True
+    if isinstance(value, list):
+        return all(_is_json_exact(v) for v in value)
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and _is_json_exact(v) for k, v in value.items())
+    return False
+
+
+def _write_cache(config_path: Path, digest: str, config: dict) -> None:
+    """
+    パース結果をキャッシュに保存（失敗しても処理は継続）
+
+    日付などJSONで表せない値を含む場合は型が変わるため保存しない
+    （次回もYAMLからパースする）。
+    """
+    if not _is_json_exact(config):
+        return
+
+    cache_path = _cache_path(config_path)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump({"hash": digest, "config": config}, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"[WARNING] 設定キャッシュの保存に失敗: {e}")
+
+
+def parse_config_bytes(config_path: Path, data: bytes) -> dict:
+    """
+    設定ファイルの内容をパース（キャッシュ優先）
+
+    Args:
+        config_path: 設定ファイルのパス（キャッシュの保存先決定に使用）
+        data: 設定ファイルの内容
+
+    Returns:
+        dict: パース済みの設定
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    config = _read_cache(config_path, digest)
+    if config is not None:
+        return config
+
+    config = yaml.load(data.decode("utf-8"), Loader=_YamlLoader) or {}
+    _write_cache(config_path, digest, config)
+    return config
+
+
+def load_config(config_path: Path) -> dict:
+    """設定ファイルを読み込む"""
+    if not config_path.exists():
+        print(f"[ERROR] 設定ファイルが見つかりません: {config_path}")
+        return {"products": []}
+
+    return parse_config_bytes(config_path, config_path.read_bytes())
+
+
+def load_products(config_path: Path) -> list[dict]:
+    """監視対象商品のみ取得"""
+    config = load_config(config_path)
+    products = config.get("products", [])
+    return [p for p in products if p.get("enabled", True)]
+
+
+def save_config(config_path: Path, config: dict) -> None:
+    """設定ファイルを保存（キャッシュも同時に更新）"""
+    text = yaml.dump(config, Dumper=_YamlDumper, allow_unicode=True, sort_keys=False)
+    data = text.encode("utf-8")
+    config_path.write_bytes(data)
+    _write_cache(config_path, hashlib.sha256(data).hexdigest(), config)
+
+
+def validate_config(config) -> list[str]:
+    """
+    設定内容をスキーマに照らして検証
+
+    Args:
+        config: パース済みの設定
+
+    Returns:
+        list[str]: エラーメッセージのリスト（問題なければ空）
+    """
+    if not isinstance(config, dict):
+        return ["設定のトップレベルはマッピングである必要があります"]
+
+    products = config.get("products", [])
+    if not isinstance(products, list):
+        return ["products はリストである必要があります"]
+
+    errors = []
+    seen_urls = set()
+    for i, product in enumerate(products):
+        where = f"products[{i}]"
+        if not isinstance(product, dict):
+            errors.append(f"{where}: マッピングである必要があります")
+            continue
+
+        for key in ("name", "url", "site"):
+            value = product.get(key)
+            if not isinstance(value, str) or not value:
+                errors.append(f"{where}.{key}: 空でない文字列が必要です")
+
+        url = product.get("url")
+        if isinstance(url, str) and url:
+            if not url.startswith(("http://", "https://")):
+                errors.append(f"{where}.url: http(s)のURLではありません")
+            if url in seen_urls:
+                errors.append(f"{where}.url: URLが重複しています")
+            seen_urls.add(url)
+
+        if "enabled" in product and not isinstance(product["enabled"], bool):
+            errors.append(f"{where}.enabled: true/false で指定してください")
+
+        interval = product.get("interval")
+        if interval is not None and (
+            isinstance(interval, bool) or not isinstance(interval, (int, float)) or interval <= 0
+        ):
+            errors.append(f"{where}.interval: 正の秒数で指定してください")
+
+    return errors
+
+
+@dataclass
+class ConfigDiff:
+    """設定変更の差分（商品URLのリスト）"""
+    added: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    enabled: list[str] = field(default_factory=list)
+    disabled: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return any((self.added, self.removed, self.enabled, self.disabled, self.updated))
+
+    def summary(self) -> str:
+        """差分の概要を表示用文字列で返す"""
+        return (
+            f"追加 {len(self.added)}件 / 削除 {len(self.removed)}件 / "
+            f"有効化 {len(self.enabled)}件 / 無効化 {len(self.disabled)}件 / "
+            f"変更 {len(self.updated)}件"
+        )
+
+
+def diff_products(old: dict[str, dict], new: dict[str, dict]) -> ConfigDiff:
+    """
+    URLをキーにした商品マップ同士の差分を計算
+
+    Args:
+        old: 変更前の商品（URL → 商品設定）
+        new: 変更後の商品（URL → 商品設定）
+
+    Returns:
+        ConfigDiff: 差分
+    """
+    diff = ConfigDiff()
+    for url, product in new.items():
+        before = old.get(url)
+        if before is None:
+            diff.added.append(url)
+            continue
+
+        was_enabled = before.get("enabled", True)
+        is_enabled = product.get("enabled", True)
+        if was_enabled != is_enabled:
+            (diff.enabled if is_enabled else diff.disabled).append(url)
+        elif before != product:
+            diff.updated.append(url)
+
+    diff.removed = [url for url in old if url not in new]
+    return diff
+
+
+class ConfigWatcher:
+    """
+    設定ファイルの変更を監視し、商品単位の差分を返す
+
+    mtimeが変わった場合のみ内容のハッシュを比較し、
+    内容が変わっていればスキーマ検証の上で差分を適用する。
+    検証に失敗した変更は無視し、直前の有効な設定を維持する。
+    """
+
+    def __init__(self, config_path: Path):
+        self.config_path = config_path
+        self.products: dict[str, dict] = {}
+        self._mtime: float | None = None
+        self._digest: str | None = None
+
+    def active_products(self) -> list[dict]:
+        """有効な商品のみ取得"""
+        return [p for p in self.products.values() if p.get("enabled", True)]
+
+    def poll(self) -> ConfigDiff | None:
+        """
+        設定ファイルの変更を確認
+
+        Returns:
+            ConfigDiff or None: 有効な変更があれば差分、なければNone
+        """
+        try:
+            mtime = self.config_path.stat().st_mtime
+        except OSError as e:
+            print(f"[ERROR] 設定ファイルを確認できません: {e}")
+            return None
+        if mtime == self._mtime:
+            return None
+
+        try:
+            data = self.config_path.read_bytes()
+        except OSError as e:
+            print(f"[ERROR] 設定ファイルを読み込めません（変更を無視します）: {e}")
+            return None
+        self._mtime = mtime
+
+        digest = hashlib.sha256(data).hexdigest()
+        if digest == self._digest:
+            return None
+        self._digest = digest
+
+        try:
+            config = parse_config_bytes(self.config_path, data)
+        except (yaml.YAMLError, UnicodeDecodeError) as e:
+            print(f"[ERROR] 設定ファイルのパースに失敗（変更を無視します）: {e}")
+            return None
+
+        errors = validate_config(config)
+        if errors:
+            print("[ERROR] 設定ファイルが不正です（変更を無視します）")
+            for error in errors:
+                print(f"        {error}")
+            return None
+
+        new_products = {p["url"]: p for p in config.get("products", [])}
+        diff = diff_products(self.products, new_products)
+        self.products = new_products
+        return diff
@@ -0,0 +1,135 @@
+"""
+診断データ保存モジュール
+
+遅いチェックや取得失敗の原因を調べるため、
+Pythonプロファイラの結果とPlaywrightトレースを保存する。
+保存先ディレクトリは合計サイズの上限を超えると古いファイルから削除する。
+"""
+
+import cProfile
+import io
+import pstats
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+# 診断データのデフォルト保存先
+DIAGNOSTICS_DIR = Path(__file__).parent / "diagnostics"
+
+# 保存先ディレクトリの合計サイズ上限（バイト）
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+# この秒数を超えたチェックのトレースを保存する
+DEFAULT_SLOW_THRESHOLD = 20.0
+
+# ローテーション対象（このモジュールが書き出すファイルのみ）
+OUTPUT_PATTERNS = ("trace_*.zip", "profile_*.prof", "profile_*.txt")
+
+
+@dataclass
+class TraceSettings:
+    """Playwrightトレースの記録設定"""
+    output_dir: Path = DIAGNOSTICS_DIR
+    slow_threshold: float = DEFAULT_SLOW_THRESHOLD
+    always: bool = False
+    max_bytes: int = DEFAULT_MAX_BYTES
+
+    def should_save(self, elapsed: float, failed: bool) -> bool:
+        """トレースを保存すべきか判定（遅延・失敗時、またはalways指定時）"""
+        return self.always or failed or elapsed >= self.slow_threshold
+
+
+def make_output_path(output_dir: Path, prefix: str, suffix: str) -> Path:
+    """タイムスタンプ付きの出力ファイルパスを生成"""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    return output_dir / f"{prefix}_{timestamp}{suffix}"
+
+
+def rotate_output_dir(output_dir: Path, max_bytes: int, keep: tuple[Path, ...] = ()) -> None:
+    """
+    合計サイズが上限以下になるまで古い診断ファイルから削除
+
+    対象はこのモジュールが書き出したファイル（OUTPUT_PATTERNS）のみ。
+    最新のファイルと keep に指定したファイルは削除しない。
+
+    Args:
+        output_dir: 診断データの保存先
+        max_bytes: 合計サイズの上限（バイト）
+        keep: 削除しないファイル（直前に保存したものなど）
+    """
+    if not output_dir.exists():
+        return
+
+    files = sorted(
+        {f for pattern in OUTPUT_PATTERNS for f in output_dir.glob(pattern) if f.is_file()},
+        key=lambda f: f.stat().st_mtime,
+    )
+    total = sum(f.stat().st_size for f in files)
+    protected = set(keep) | set(files[-1:])
+
+    for f in files:
+        if total <= max_bytes:
+            break
+        if f in protected:
+            continue
+        total -= f.stat().st_size
+        f.unlink()
+        print(f"[INFO] 古い診断ファイルを削除しました: {f.name}")
+
+
+async def start_trace(context) -> None:
+    """ブラウザコンテキストでトレース記録を開始"""
+    await context.tracing.start(screenshots=True, snapshots=True)
+
+
+async def stop_trace(context, settings: TraceSettings, label: str, elapsed: float, failed: bool) -> Path | None:
+    """
+    トレース記録を終了し、条件を満たす場合のみファイルに保存
+
+    Returns:
+        Path or None: 保存したトレースのパス、破棄した場合はNone
+    """
+    if not settings.should_save(elapsed, failed):
+        await context.tracing.stop()
+        return None
+
+    path = make_output_path(settings.output_dir, f"trace_{label}", ".zip")
+    await context.tracing.stop(path=str(path))
+    rotate_output_dir(settings.output_dir, settings.max_bytes, keep=(path,))
+    print(f"[INFO] トレースを保存しました: {path}")
+    print(f"        確認: playwright show-trace {path}")
+    return path
+
+
+def run_with_profile(func, *args, output_dir: Path = DIAGNOSTICS_DIR, max_bytes: int = DEFAULT_MAX_BYTES, top: int = 25):
+    """
+    関数をcProfileで計測しながら実行し、結果を保存
+
+    SystemExitなどで中断された場合も計測結果は保存する。
+
+    Args:
+        func: 実行する関数
+        output_dir: プロファイル結果の保存先
+        max_bytes: 保存先ディレクトリの合計サイズ上限
+        top: 表示する上位関数の数
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        path = make_output_path(output_dir, "profile", ".prof")
+        profiler.dump_stats(str(path))
+
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(top)
+        summary_path = path.with_suffix(".txt")
+        summary_path.write_text(stream.getvalue(), encoding="utf-8")
+
+        rotate_output_dir(output_dir, max_bytes, keep=(path, summary_path))
+        print("\n" + "=" * 60)
+        print("プロファイル結果（累積時間順）")
+        print("=" * 60)
+        print(stream.getvalue())
+        print(f"[INFO] プロファイルを保存しました: {path}")
@@ -0,0 +1,309 @@
+"""
+ブラウザエンジン選択モジュール
+
+サイトごと・エンジンごとに成功率、所要時間、メモリ使用量を記録し、
+取得に成功しているエンジンの中で最もコストの低いものへ振り分ける。
+一定時間ごとに他のエンジンも試行（再計測）し、状況の変化に追従する。
+"""
+
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+
+from sites import get_handler
+
+# 対応エンジン
+BROWSER_ENGINES = ("chromium", "firefox", "webkit")
+
+# 計測結果の保存先
+ENGINE_STATS_FILE = Path(__file__).parent / ".cache" / "engine_stats.json"
+
+# 計測値の指数移動平均の重み（新しい値の比率）
+EWMA_ALPHA = 0.3
+
+# 成功率は直近この回数の結果から計算する
+RECENT_WINDOW = 10
+
+# 直近の結果がこの回数以上あるエンジンのみ成功率・コストを評価する
+MIN_SAMPLES = 3
+
+# この成功率を下回るエンジンは選択しない（直近10回中3回の失敗で下回る）
+MIN_SUCCESS_RATE = 0.8
+
+# 他エンジンを再計測する間隔（秒）
+REPROBE_INTERVAL = 6 * 60 * 60
+
+# 起動に失敗したエンジンを再び候補にするまでの間隔（秒）
+LAUNCH_RETRY_INTERVAL = 24 * 60 * 60
+
+# メモリ1MBあたりのコスト（秒換算、1GBで約10秒）
+MEMORY_COST_PER_MB = 0.01
+
+
+def _ewma(current: float | None, value: float) -> float:
+    if current is None:
+        return value
+    return current + EWMA_ALPHA * (value - current)
+
+
+def _success_rate(stats: dict) -> float | None:
+    """直近の結果から成功率を計算（結果がなければNone）"""
+    recent = stats.get("recent") or []
+    if not recent:
+        return None
+    return sum(recent) / len(recent)
+
+
+def measure_engine_memory() -> dict[str, float]:
+    """
+    起動中ブラウザのメモリ使用量（RSS合計、MB）をエンジンごとに取得
+
+    自プロセスの子孫プロセスを /proc から辿って集計する。
+    Linux以外では空の辞書を返す。
+    """
+    proc = Path("/proc")
+    if not proc.exists():
+        return {}
+
+    children: dict[int, list[int]] = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # comm にスペースや括弧が含まれる場合があるため末尾の ")" 以降を使う
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+
+    page_mb = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    usage: dict[str, float] = {}
+    stack = list(children.get(os.getpid(), []))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            cmdline = (proc / str(pid) / "cmdline").read_bytes().decode(errors="ignore").lower()
+            resident = int((proc / str(pid) / "statm").read_text().split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        for engine in BROWSER_ENGINES:
+            key = "chrom" if engine == "chromium" else engine
+            if key in cmdline:
+                usage[engine] = usage.get(engine, 0.0) + resident * page_mb
+                break
+    return usage
+
+
+class BrowserPool:
+    """起動済みブラウザの管理（必要なエンジンのみ並列起動）"""
+
+    def __init__(self, playwright):
+        self._playwright = playwright
+        self.browsers: dict[str, object] = {}
+        self.unavailable: set[str] = set()
+
+    def discard_if_disconnected(self, engine: str) -> None:
+        """クラッシュなどで切断されたブラウザを破棄（次回の ensure で再起動）"""
+        browser = self.browsers.get(engine)
+        if browser is not None and not browser.is_connected():
+            print(f"[WARNING] {engine} が切断されました。次回のチェック前に再起動します")
+            del self.browsers[engine]
+
+    async def ensure(self, engines) -> set[str]:
+        """
+        指定エンジンのうち未起動（または切断済み）のものを並列に起動
+
+        Returns:
+            set[str]: 今回起動に失敗したエンジン
+        """
+        for engine in list(self.browsers):
+            self.discard_if_disconnected(engine)
+
+        missing = [
+            e for e in engines
+            if e not in self.browsers and e not in self.unavailable
+        ]
+        if not missing:
+            return set()
+
+        print(f"[INFO] ブラウザを起動中: {', '.join(missing)}")
+        results = await asyncio.gather(
+            *(getattr(self._playwright, e).launch(headless=True) for e in missing),
+            return_exceptions=True,
+        )
+
+        failed = set()
+        for engine, result in zip(missing, results):
+            if isinstance(result, Exception):
+                print(f"[WARNING] {engine} を起動できません（しばらく候補から除外します）: {result}")
+                self.unavailable.add(engine)
+                failed.add(engine)
+            else:
+                self.browsers[engine] = result
+        return failed
+
+    def get(self, engine: str):
+        """エンジンに対応するブラウザを取得"""
+        return self.browsers.get(engine)
+
+    async def close(self) -> None:
+        """起動済みブラウザをすべて閉じる"""
+        for browser in self.browsers.values():
+            await browser.close()
+        self.browsers.clear()
+
+
+class EngineRouter:
+    """
+    サイトごとのエンジン振り分け
+
+    計測結果は stats_path に保存し、実行をまたいで引き継ぐ。
+    """
+
+    def __init__(self, stats_path: Path = ENGINE_STATS_FILE, allowed: list[str] | None = None):
+        self.stats_path = stats_path
+        self.allowed = allowed
+        self.sites: dict[str, dict] = {}
+        self.launch_failures: dict[str, float] = {}
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.sites = data.get("sites", {})
+        self.launch_failures = data.get("launch_failures", {})
+
+    def save(self) -> None:
+        """計測結果を保存（失敗しても処理は継続）"""
+        try:
+            self.stats_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.stats_path, "w", encoding="utf-8") as f:
+                json.dump({"sites": self.sites, "launch_failures": self.launch_failures}, f, indent=2)
+        except OSError as e:
+            print(f"[WARNING] エンジン計測結果の保存に失敗: {e}")
+
+    def candidates(self, site_id: str, exclude: set[str] = frozenset()) -> list[str]:
+        """サイトで使用可能なエンジン（ハンドラーの優先順）"""
+        handler = get_handler(site_id)
+        if not handler:
+            return []
+
+        now = time.time()
+        engines = [
+            e for e in handler.PREFERRED_ENGINES
+            if e not in exclude and now - self.launch_failures.get(e, 0.0) >= LAUNCH_RETRY_INTERVAL
+        ]
+        if self.allowed is not None:
+            engines = [e for e in engines if e in self.allowed]
+        return engines
+
+    def cost(self, site_id: str, engine: str) -> float:
+        """エンジンのコスト（平均所要時間 + メモリ換算）"""
+        stats = self.sites.get(site_id, {}).get("engines", {}).get(engine, {})
+        latency = stats.get("latency") or 0.0
+        return latency + (stats.get("memory_mb") or 0.0) * MEMORY_COST_PER_MB
+
+    def _is_proven(self, stats: dict) -> bool:
+        return len(stats.get("recent") or []) >= MIN_SAMPLES and _success_rate(stats) >= MIN_SUCCESS_RATE
+
+    def _is_known_bad(self, stats: dict) -> bool:
+        return len(stats.get("recent") or []) >= MIN_SAMPLES and _success_rate(stats) < MIN_SUCCESS_RATE
+
+    def best_engine(self, site_id: str, exclude: set[str] = frozenset()) -> str | None:
+        """
+        サイトに最適なエンジンを選択
+
+        十分に計測済みで成功しているエンジンがあれば最低コストのもの、
+        なければ失敗が確定していないエンジンをハンドラーの優先順で選ぶ。
+        実績のあるエンジンがある限り、未計測のエンジンへは切り替えない
+        （未計測のエンジンは再計測で MIN_SAMPLES に達するまで試す）。
+        """
+        engines = self.candidates(site_id, exclude)
+        if not engines:
+            return None
+
+        site_stats = self.sites.get(site_id, {}).get("engines", {})
+        proven = [e for e in engines if self._is_proven(site_stats.get(e, {}))]
+        if proven:
+            return min(proven, key=lambda e: self.cost(site_id, e))
+
+        for engine in engines:
+            if not self._is_known_bad(site_stats.get(engine, {})):
+                return engine
+
+        # すべて失敗続きの場合は成功率が最も高いもの
+        return max(engines, key=lambda e: _success_rate(site_stats.get(e, {})) or 0.0)
+
+    def _probe_engine(self, site_id: str, best: str, exclude: set[str]) -> str | None:
+        """再計測の時期であれば、最も長く使われていない代替エンジンを返す"""
+        site = self.sites.get(site_id)
+        if not site or not site.get("engines"):
+            return None
+        if time.time() - site.get("last_probe", 0.0) < REPROBE_INTERVAL:
+            return None
+
+        alternatives = [e for e in self.candidates(site_id, exclude) if e != best]
+        if not alternatives:
+            return None
+        return min(alternatives, key=lambda e: site["engines"].get(e, {}).get("last_used", 0.0))
+
+    def plan(
+        self, products: list[dict], exclude: set[str] = frozenset()
+    ) -> tuple[dict[str, str], list[tuple[dict, str]]]:
+        """
+        商品ごとに使用するエンジンを決定
+
+        通常のチェックは常に最適なエンジンに割り当てる。再計測の時期になった
+        サイトは、1商品だけ代替エンジンでの追加チェックを再計測として返す。
+
+        Returns:
+            tuple: (商品URL → エンジン, [(商品, 再計測エンジン)])
+        """
+        assignments = {}
+        probes = []
+        best_by_site: dict[str, str | None] = {}
+
+        for product in products:
+            site_id = product["site"]
+            first = site_id not in best_by_site
+            if first:
+                best_by_site[site_id] = self.best_engine(site_id, exclude)
+            best = best_by_site[site_id]
+            if best is None:
+                continue
+
+            assignments[product["url"]] = best
+            if first:
+                probe = self._probe_engine(site_id, best, exclude)
+                if probe:
+                    probes.append((product, probe))
+        return assignments, probes
+
+    def mark_probed(self, site_id: str) -> None:
+        """再計測を実施したことを記録（次回は REPROBE_INTERVAL 後）"""
+        self.sites.setdefault(site_id, {"engines": {}})["last_probe"] = time.time()
+
+    def record_launch_failure(self, engine: str) -> None:
+        """起動に失敗したエンジンを記録（LAUNCH_RETRY_INTERVAL の間は選択しない）"""
+        self.launch_failures[engine] = time.time()
+
+    def record(
+        self, site_id: str, engine: str, elapsed: float | None, success: bool, memory_mb: float | None = None
+    ) -> None:
+        """チェック結果を記録（elapsedがNoneの場合は所要時間を更新しない）"""
+        site = self.sites.setdefault(site_id, {"engines": {}, "last_probe": time.time()})
+        stats = site["engines"].setdefault(engine, {"attempts": 0, "recent": [], "latency": None})
+        stats["attempts"] += 1
+        stats["recent"] = (stats.get("recent") or [])[-(RECENT_WINDOW - 1):] + [1 if success else 0]
+        if success and elapsed is not None:
+            stats["latency"] = _ewma(stats["latency"], elapsed)
+        if memory_mb is not None:
+            stats["memory_mb"] = _ewma(stats.get("memory_mb"), memory_mb)
+        stats["last_used"] = time.time()
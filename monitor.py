@@ -10,18 +10,32 @@ import os
 import sys
 import argparse
 import asyncio
+import time
 from pathlib import Path
 from datetime import datetime
 
-import yaml
 import requests
 from playwright.async_api import async_playwright
 
 from sites import get_handler, ProductInfo
+from config_store import ConfigWatcher, load_config, load_products, save_config
+from engines import BROWSER_ENGINES, BrowserPool, EngineRouter, measure_engine_memory
+from diagnostics import (
+    DIAGNOSTICS_DIR,
+    DEFAULT_MAX_BYTES,
+    DEFAULT_SLOW_THRESHOLD,
+    TraceSettings,
+    run_with_profile,
+    start_trace,
+    stop_trace,
+)
 
 # 設定ファイルのデフォルトパス
 CONFIG_FILE = Path(__file__).parent / "config.yaml"
 
+# 常駐モードで設定ファイルの変更を確認する間隔（秒）
+CONFIG_POLL_INTERVAL = 5.0
+
 
 def infer_site_from_url(url: str) -> str:
     """URLからサイトIDを推測"""
@@ -36,31 +50,6 @@ def infer_site_from_url(url: str) -> str:
     return "unknown"
 
 
-def load_config(config_path: Path) -> dict:
-    """設定ファイルを読み込む"""
-    if not config_path.exists():
-        print(f"[ERROR] 設定ファイルが見つかりません: {config_path}")
-        return {"products": []}
-
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f) or {}
-
-    return config
-
-
-def load_products(config_path: Path) -> list[dict]:
-    """監視対象商品のみ取得"""
-    config = load_config(config_path)
-    products = config.get("products", [])
-    return [p for p in products if p.get("enabled", True)]
-
-
-def save_config(config_path: Path, config: dict) -> None:
-    """設定ファイルを保存"""
-    with open(config_path, "w", encoding="utf-8") as f:
-        yaml.safe_dump(config, f, allow_unicode=True, sort_keys=False)
-
-
 def send_discord_notification(webhook_url: str, product_info: ProductInfo, site_name: str) -> bool:
     """Discord Webhookで通知を送信"""
     
@@ -91,16 +80,15 @@ def send_discord_notification(webhook_url: str, product_info: ProductInfo, site_
         return False
 
 
-async def check_single_product(browser, product: dict, webhook_url: str, dry_run: bool) -> dict:
-    """単一商品の在庫をチェック"""
-    handler = get_handler(product["site"])
-    if not handler:
-        print(f"[WARNING] 未対応サイト: {product['site']}")
-        return {"product": product, "status": "未対応サイト", "available": False}
-    
-    print(f"\n[CHECK] {product['name']} ({handler.SITE_NAME})")
-    print(f"        URL: {product['url']}")
-    
+async def fetch_with_browser(
+    browser, handler, product: dict, trace: TraceSettings | None = None
+) -> tuple[ProductInfo | None, float]:
+    """
+    ブラウザで商品情報を取得（trace指定時は遅延・失敗時のみトレースを保存）
+
+    Returns:
+        tuple: (商品情報、取得失敗時はNone, 所要時間（トレース処理の時間を除く秒数）)
+    """
     # サイトに応じたブラウザ設定
     context_options = {
         "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
@@ -122,30 +110,161 @@ async def check_single_product(browser, product: dict, webhook_url: str, dry_run
         }
     }
     
+    started = time.perf_counter()
     context = await browser.new_context(**context_options)
-    page = await context.new_page()
+    if trace:
+        # トレース開始の時間は所要時間に含めない
+        trace_started = time.perf_counter()
+        await start_trace(context)
+        started += time.perf_counter() - trace_started
     
+    info = None
     try:
+        page = await context.new_page()
         info = await handler.fetch_product_info(page, product["url"])
+    finally:
+        elapsed = time.perf_counter() - started
+        try:
+            if trace:
+                try:
+                    await stop_trace(context, trace, product["site"], elapsed, failed=info is None)
+                except Exception as e:
+                    # トレース保存の失敗で取得結果やエラーを上書きしない
+                    print(f"        [WARNING] トレースの保存に失敗: {e}")
+        finally:
+            await context.close()
+    return info, elapsed
+
+
+async def check_single_product(
+    browser, product: dict, webhook_url: str, dry_run: bool, trace: TraceSettings | None = None
+) -> dict:
+    """単一商品の在庫をチェック"""
+    handler = get_handler(product["site"])
+    if not handler:
+        print(f"[WARNING] 未対応サイト: {product['site']}")
+        return {"product": product, "status": "未対応サイト", "available": False}
+    
+    print(f"\n[CHECK] {product['name']} ({handler.SITE_NAME})")
+    print(f"        URL: {product['url']}")
+    print(f"        エンジン: {browser.browser_type.name}")
+    
+    info, elapsed = await fetch_with_browser(browser, handler, product, trace)
+    print(f"        所要時間: {elapsed:.1f}秒")
+    
+    if info:
+        print(f"        商品名: {info.name}")
+        print(f"        価格: {info.price}")
+        print(f"        状態: {info.status}")
+        print(f"        購入可能: {'はい ✅' if info.is_available else 'いいえ'}")
         
-        if info:
-            print(f"        商品名: {info.name}")
-            print(f"        価格: {info.price}")
-            print(f"        状態: {info.status}")
-            print(f"        購入可能: {'はい ✅' if info.is_available else 'いいえ'}")
-            
-            if info.is_available:
-                print(f"[ALERT] ★★★ 在庫復活！ ★★★")
-                if not dry_run and webhook_url:
-                    send_discord_notification(webhook_url, info, handler.SITE_NAME)
-            
-            return {"product": product, "status": info.status, "available": info.is_available}
-        else:
-            print(f"        [ERROR] 情報取得失敗")
+        if info.is_available:
+            print(f"[ALERT] ★★★ 在庫復活！ ★★★")
+            if not dry_run and webhook_url:
+                send_discord_notification(webhook_url, info, handler.SITE_NAME)
+        
+        return {"product": product, "status": info.status, "available": info.is_available, "elapsed": elapsed}
+    else:
+        print(f"        [ERROR] 情報取得失敗")
+        return {"product": product, "status": "取得失敗", "available": False, "elapsed": elapsed}
+
+
+async def run_checks(
+    products: list[dict], router: EngineRouter, pool: BrowserPool,
+    webhook_url: str, dry_run: bool, trace: TraceSettings | None = None,
+) -> list[dict]:
+    """
+    エンジンを振り分けて商品をチェック
+
+    必要なエンジンはチェック開始前にまとめて並列起動し、
+    起動できなかったエンジンを除いて振り分けをやり直す。
+    再計測は通常のチェックとは別の追加チェックとして実行する。
+    """
+    while True:
+        plan, probes = router.plan(products, exclude=pool.unavailable)
+        failed = await pool.ensure(set(plan.values()) | {engine for _, engine in probes})
+        if not failed:
+            break
+        for engine in failed:
+            router.record_launch_failure(engine)
+    
+    async def check_and_record(product: dict, engine: str, notify_dry_run: bool) -> dict:
+        try:
+            result = await check_single_product(pool.get(engine), product, webhook_url, notify_dry_run, trace)
+        except Exception as e:
+            # ブラウザのクラッシュなどで1商品が失敗しても他の商品のチェックは続ける
+            print(f"        [ERROR] チェック中にエラーが発生: {e}")
+            router.record(product["site"], engine, None, False)
+            pool.discard_if_disconnected(engine)
             return {"product": product, "status": "取得失敗", "available": False}
-            
-    finally:
-        await context.close()
+        
+        if "elapsed" in result:
+            memory = measure_engine_memory().get(engine)
+            router.record(product["site"], engine, result["elapsed"], result["status"] != "取得失敗", memory)
+        return result
+    
+    results = []
+    for product in products:
+        engine = plan.get(product["url"])
+        if engine is None and get_handler(product["site"]):
+            print(f"\n[ERROR] 使用可能なエンジンがありません: {product['name']}")
+            results.append({"product": product, "status": "取得失敗", "available": False})
+            continue
+        if engine is None:
+            results.append(await check_single_product(None, product, webhook_url, dry_run, trace))
+            continue
+        
+        results.append(await check_and_record(product, engine, dry_run))
+    
+    # 再計測（通知は通常のチェックで送るため、ここでは送らない）
+    for product, engine in probes:
+        router.mark_probed(product["site"])
+        print(f"\n[INFO] {product['site']}: {engine} を再計測します（現在: {plan[product['url']]}）")
+        await check_and_record(product, engine, notify_dry_run=True)
+    
+    router.save()
+    return results
+
+
+async def watch_products(
+    watcher: ConfigWatcher, router: EngineRouter, pool: BrowserPool, webhook_url: str,
+    dry_run: bool, interval: float, trace: TraceSettings | None = None,
+) -> None:
+    """
+    常駐モード: 設定ファイルの変更を反映しながら定期チェックを続ける
+
+    変更は商品単位の差分として適用し、変更のない商品の
+    次回チェック時刻はそのまま維持する。商品ごとの間隔は
+    設定の interval（秒）で上書きできる。
+    """
+    next_check: dict[str, float] = {}
+    
+    while True:
+        diff = watcher.poll()
+        if diff:
+            print(f"\n[INFO] 設定を反映しました: {diff.summary()}")
+            for url in diff.removed + diff.disabled:
+                next_check.pop(url, None)
+        
+        now = time.monotonic()
+        due = [
+            product for product in watcher.active_products()
+            if next_check.setdefault(product["url"], now) <= now
+        ]
+        if due:
+            try:
+                await run_checks(due, router, pool, webhook_url, dry_run, trace)
+            except Exception as e:
+                # 常駐を継続し、次回の期限で再試行する
+                print(f"[ERROR] チェックの実行に失敗: {e}")
+            for product in due:
+                next_check[product["url"]] = time.monotonic() + product.get("interval", interval)
+        
+        # 次の期限か設定確認のどちらか早い方まで待機
+        wait = CONFIG_POLL_INTERVAL
+        if next_check:
+            wait = min(wait, max(0.0, min(next_check.values()) - time.monotonic()))
+        await asyncio.sleep(wait)
 
 
 async def main_async(args):
@@ -201,9 +320,17 @@ async def main_async(args):
         print(f"        enabled: {product['enabled']}")
         return
 
-    products = load_products(config_path)
+    if args.watch:
+        watcher = ConfigWatcher(config_path)
+        if watcher.poll() is None:
+            print("[WARNING] 有効な設定が読み込めません。設定ファイルが修正されるまで監視対象はありません")
+        elif not watcher.active_products():
+            print("[WARNING] 有効な監視対象がありません。設定ファイルへの追加を待機します")
+        products = watcher.active_products()
+    else:
+        products = load_products(config_path)
     
-    if not products:
+    if not products and not args.watch:
         print("[ERROR] 監視対象の商品がありません")
         sys.exit(1)
     
@@ -217,36 +344,34 @@ async def main_async(args):
             site = infer_site_from_url(args.url)
             products = [{"name": "手動指定", "url": args.url, "site": site}]
     
+    trace = None
+    if args.trace:
+        trace = TraceSettings(
+            output_dir=Path(args.diagnostics_dir),
+            slow_threshold=args.trace_threshold,
+            always=args.trace_always,
+            max_bytes=args.diagnostics_max_mb * 1024 * 1024,
+        )
+    
+    router = EngineRouter(allowed=args.engines)
+    
     async with async_playwright() as p:
-        # ブラウザを準備（Chromium + Firefox）
-        chromium_browser = await p.chromium.launch(headless=True)
-        firefox_browser = None  # 必要時のみ起動
-        
-        results = []
-        available_count = 0
-        
-        for product in products:
-            # サイトに応じてブラウザを選択
-            handler = get_handler(product["site"])
+        pool = BrowserPool(p)
+        try:
+            if args.watch:
+                # 常駐モード（Ctrl+Cで終了）
+                print(f"[INFO] 常駐モード: {args.interval:g}秒ごとにチェック、設定変更は自動で反映")
+                await watch_products(
+                    watcher, router, pool, webhook_url, args.dry_run or args.test,
+                    args.interval, trace,
+                )
             
-            if handler and getattr(handler, 'USE_FIREFOX', False):
-                # Firefoxが必要なサイト
-                if firefox_browser is None:
-                    print("[INFO] Firefoxを起動中...")
-                    firefox_browser = await p.firefox.launch(headless=True)
-                browser = firefox_browser
-            else:
-                browser = chromium_browser
-            
-            result = await check_single_product(browser, product, webhook_url, args.dry_run or args.test)
-            results.append(result)
-            if result["available"]:
-                available_count += 1
-        
-        # ブラウザを閉じる
-        await chromium_browser.close()
-        if firefox_browser:
-            await firefox_browser.close()
+            results = await run_checks(products, router, pool, webhook_url, args.dry_run or args.test, trace)
+        finally:
+            # ブラウザを閉じる
+            await pool.close()
+    
+    available_count = sum(1 for r in results if r["available"])
     
     # サマリー表示
     print("\n" + "=" * 60)
@@ -272,9 +397,61 @@ def main():
     parser.add_argument("--name", help="追加する商品の名前")
     parser.add_argument("--site", help="サイトID（省略時はURLから推定）")
     parser.add_argument("--disabled", action="store_true", help="追加時に無効化")
+    parser.add_argument("--watch", action="store_true", help="常駐モード（設定変更を自動反映）")
+    parser.add_argument("--interval", type=float, default=300.0, help="常駐モードのチェック間隔（秒、デフォルト: 300）")
+    parser.add_argument(
+        "--engines", help="使用を許可するエンジン（カンマ区切り: chromium,firefox,webkit、省略時はすべて）",
+    )
+    parser.add_argument("--profile", action="store_true", help="cProfileで実行全体を計測")
+    parser.add_argument("--trace", action="store_true", help="遅延・失敗したチェックのPlaywrightトレースを保存")
+    parser.add_argument("--trace-always", action="store_true", help="全チェックのトレースを保存（--traceを含む）")
+    parser.add_argument(
+        "--trace-threshold", type=float, default=DEFAULT_SLOW_THRESHOLD,
+        help=f"トレースを保存する所要時間の閾値（秒、デフォルト: {DEFAULT_SLOW_THRESHOLD:g}）",
+    )
+    parser.add_argument("--diagnostics-dir", default=str(DIAGNOSTICS_DIR), help="プロファイル・トレースの保存先")
+    parser.add_argument(
+        "--diagnostics-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="保存先の合計サイズ上限（MB、超過分は古い順に削除）",
+    )
     args = parser.parse_args()
     
-    asyncio.run(main_async(args))
+    # 使用を許可するエンジンを検証
+    if args.engines is not None:
+        args.engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+        unknown = [e for e in args.engines if e not in BROWSER_ENGINES]
+        if not args.engines:
+            parser.error("--engines にエンジンを1つ以上指定してください")
+        if unknown:
+            parser.error(
+                f"--engines に不明なエンジンがあります: {', '.join(unknown)}"
+                f"（指定可能: {', '.join(BROWSER_ENGINES)}）"
+            )
+    
+    if args.watch and args.url:
+        parser.error("--watch と --url は同時に指定できません")
+    
+    if args.interval <= 0:
+        parser.error("--interval は正の秒数で指定してください")
+    
+    if args.diagnostics_max_mb <= 0:
+        parser.error("--diagnostics-max-mb は1以上を指定してください")
+    
+    # --trace-always は --trace を含む
+    if args.trace_always:
+        args.trace = True
+    
+    try:
+        if args.profile:
+            run_with_profile(
+                asyncio.run, main_async(args),
+                output_dir=Path(args.diagnostics_dir),
+                max_bytes=args.diagnostics_max_mb * 1024 * 1024,
+            )
+        else:
+            asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        print("\n[INFO] 終了しました")
 
 
 if __name__ == "__main__":
@@ -34,6 +34,9 @@ class BaseSiteHandler(ABC):
     # 売り切れと判定するキーワード
     SOLDOUT_KEYWORDS: list[str] = ["売り切れ", "在庫なし", "販売終了"]
     
+    # 使用可能なブラウザエンジン（計測結果がない間はこの順で選択）
+    PREFERRED_ENGINES: list[str] = ["chromium", "firefox", "webkit"]
+    
     @abstractmethod
     async def fetch_product_info(self, page: Page, url: str) -> ProductInfo | None:
         """
@@ -1,8 +1,8 @@
 """
-ビックカメラ用サイトハンドラー（Firefox版）
+ビックカメラ用サイトハンドラー
 
-ビックカメラはChromiumでBot対策により弾かれるため、
-Firefoxブラウザを使用する。
+ビックカメラはChromiumでBot対策により弾かれることがあるため、
+計測結果がない間はFirefoxを優先する。
 """
 
 from playwright.async_api import Page
@@ -10,13 +10,13 @@ from .base import BaseSiteHandler, ProductInfo
 
 
 class BiccameraHandler(BaseSiteHandler):
-    """ビックカメラ専用のハンドラー（Firefox使用）"""
+    """ビックカメラ専用のハンドラー（Firefox優先）"""
     
     SITE_ID = "biccamera"
     SITE_NAME = "ビックカメラ"
     
-    # Firefoxを使用するフラグ
-    USE_FIREFOX = True
+    # Firefoxを優先して使用
+    PREFERRED_ENGINES = ["firefox", "chromium", "webkit"]
     
     AVAILABLE_KEYWORDS = ["カートに入れる", "予約する", "在庫あり"]
     SOLDOUT_KEYWORDS = ["売り切れ", "在庫なし", "販売終了", "販売休止中", "予定数の販売を終了"]